@@ -0,0 +1,18 @@
+"""
+Gunicorn configuration: run with `gunicorn -c gunicorn_conf.py main:app`.
+
+Async workers sized by the usual 2*cpu+1 rule; the bcrypt process pool in
+main.py pins its own workers to the high-numbered cores, so the event-loop
+workers and the hash workers do not fight over the same CPUs.
+"""
+
+import multiprocessing
+
+workers = 2 * multiprocessing.cpu_count() + 1
+worker_class = "uvicorn.workers.UvicornWorker"
+# Import the app before forking so the bcrypt/orjson C extensions are mapped
+# once and shared by all workers. Safe because main.py builds its process pool
+# lazily post-fork; a pool inherited from the master would share pipes across
+# workers and misdeliver results.
+preload_app = True
+bind = "0.0.0.0:8000"
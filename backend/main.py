@@ -1,10 +1,24 @@
+import asyncio
+import fcntl
+import hashlib
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cachetools import TTLCache
+
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import orjson
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import Optional
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from enum import Enum
+import jwt
+import bcrypt
+from pymongo.errors import DuplicateKeyError
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
 # Database helpers (MongoDB) provided by environment
@@ -13,11 +27,67 @@ from database import db, create_document, get_documents
 SECRET_KEY = "supersecretkey"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-app = FastAPI(title="Bina Ragam API")
+# Built once; FastAPI only reads its fields, so the instance is safe to reuse.
+CREDENTIALS_EXCEPTION = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+# Use the cores this process may actually run on (cgroup/cpuset aware), not
+# the machine-wide count os.cpu_count() reports.
+if hasattr(os, "sched_getaffinity"):
+    _AVAILABLE_CORES = sorted(os.sched_getaffinity(0))
+else:
+    _AVAILABLE_CORES = list(range(os.cpu_count() or 1))
+_HASH_WORKERS = max(1, len(_AVAILABLE_CORES) // 2)
+# High-numbered cores for hashing; low ones stay free for the event loops.
+_HASH_CORES = set(_AVAILABLE_CORES[-_HASH_WORKERS:])
+
+
+def _init_hash_worker():
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, _HASH_CORES)
+        except OSError:
+            # Pinning is best-effort; a failed pin must not brick the pool.
+            pass
+    _warm_bcrypt()
+
+
+def _warm_bcrypt():
+    # Cheap hash at worker start so bcrypt's code and S-box tables are already
+    # paged in when the first real login arrives.
+    bcrypt.hashpw(b"warmup", bcrypt.gensalt(rounds=4))
+
+
+# bcrypt is deliberately CPU-heavy, so hashing in the handler would block the
+# event loop for every in-flight request. Run it in a process pool instead.
+# Created lazily: under gunicorn with preload_app the module is imported in the
+# master, and an executor built pre-fork would share its queue pipes across all
+# forked workers, cross-delivering results between their futures.
+HASH_POOL = None
+
+
+def _get_hash_pool():
+    global HASH_POOL
+    if HASH_POOL is None:
+        HASH_POOL = ProcessPoolExecutor(max_workers=_HASH_WORKERS, initializer=_init_hash_worker)
+    return HASH_POOL
+
+# Validated JWT payloads keyed by token hash, so repeat requests with the same
+# bearer token skip the HMAC verification. Entries never outlive the token exp.
+JWT_CACHE = TTLCache(maxsize=10_000, ttl=60)
+
+# Resolved user documents keyed by user id, so repeat authenticated requests
+# skip the Mongo round trip. Invalidated when a user is deleted.
+USER_CACHE = TTLCache(maxsize=10_000, ttl=60)
+
+app = FastAPI(title="Bina Ragam API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,19 +97,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.on_event("startup")
+async def create_indexes():
+    if db is None:
+        return
+    # Under gunicorn every worker runs startup; the flock makes sure only one
+    # of them issues the create_index calls instead of all N racing Mongo.
+    lock_path = os.path.join(tempfile.gettempdir(), "bina_ragam_indexes.lock")
+    with open(lock_path, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+        await db["user"].create_index("email", unique=True)
+        await db["product"].create_index([("category", 1), ("price", 1)])
+        await db["product"].create_index([("name", "text"), ("description", "text")])
+
+
+@app.on_event("startup")
+async def warm_hash_pool():
+    # Startup runs post-fork in each worker, so the pool built here is private
+    # to this process. Spawn its workers now (running their bcrypt warm-up
+    # initializer) instead of on the first login.
+    await asyncio.get_running_loop().run_in_executor(_get_hash_pool(), _warm_bcrypt)
+
 # ======================
 # Schemas
 # ======================
+class Role(str, Enum):
+    user = "user"
+    admin = "admin"
+
+# Shape check only — pydantic-core's precompiled regex, no email-validator /
+# DNS work on the login hot path.
+EMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
+
 class UserCreate(BaseModel):
     name: str
-    email: EmailStr
+    email: str = Field(pattern=EMAIL_PATTERN)
     password: str
-    role: str = Field(default="user", regex="^(admin|user)$")
+    role: Role = Role.user
 
 class UserPublic(BaseModel):
     id: str
     name: str
-    email: EmailStr
+    email: str
     role: str
     created_at: datetime
 
@@ -73,42 +176,86 @@ class ProductPublic(ProductCreate):
 class WishlistCreate(BaseModel):
     product_id: str
 
+# Precompiled adapter so hot POST handlers dump straight through pydantic-core.
+PRODUCT_ADAPTER = TypeAdapter(ProductCreate)
+
+# Server-side projections producing exactly the wire shape (minus _id -> id).
+PRODUCT_PROJECTION = {
+    "name": 1,
+    "description": 1,
+    "image_url": 1,
+    "price": 1,
+    "marketplace_link": 1,
+    "discount_id": 1,
+    "category": 1,
+    "created_at": 1,
+}
+
+USER_PROJECTION = {
+    "name": 1,
+    "email": 1,
+    "role": 1,
+    "created_at": 1,
+}
+
+DISCOUNT_PROJECTION = {
+    "percentage": 1,
+    "start_date": 1,
+    "end_date": 1,
+    "active": 1,
+    "created_at": 1,
+}
+
 # ======================
 # Utils
 # ======================
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+def _verify_password_sync(plain_password, hashed_password):
+    return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+
 
+def _hash_password_sync(password):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+
+async def verify_password(plain_password, hashed_password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_hash_pool(), _verify_password_sync, plain_password, hashed_password)
+
+
+async def get_password_hash(password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_hash_pool(), _hash_password_sync, password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    # RFC 7519 exp is epoch seconds; skip the datetime round trip entirely.
+    expires_in = int(expires_delta.total_seconds()) if expires_delta else ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    to_encode["exp"] = int(time.time()) + expires_in
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    users = await get_documents("user", {"_id": user_id}, limit=1)
-    if not users:
-        raise credentials_exception
-    user = users[0]
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    payload = JWT_CACHE.get(cache_key)
+    if payload is None or payload.get("exp", 0) <= time.time():
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except jwt.PyJWTError:
+            raise CREDENTIALS_EXCEPTION
+        JWT_CACHE[cache_key] = payload
+    user_id: str = payload.get("sub")
+    if user_id is None:
+        raise CREDENTIALS_EXCEPTION
+    user = USER_CACHE.get(user_id)
+    if user is None:
+        users = await get_documents("user", {"_id": user_id}, limit=1)
+        if not users:
+            raise CREDENTIALS_EXCEPTION
+        user = users[0]
+        user.pop("password", None)
+        USER_CACHE[user_id] = user
     return user
 
 async def require_admin(user=Depends(get_current_user)):
@@ -121,35 +268,37 @@ async def require_admin(user=Depends(get_current_user)):
 # ======================
 @app.post("/auth/register", response_model=UserPublic)
 async def register(payload: UserCreate):
-    existing = await get_documents("user", {"email": payload.email}, limit=1)
-    if existing:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    hashed = get_password_hash(payload.password)
+    hashed = await get_password_hash(payload.password)
     user_doc = {
         "name": payload.name,
         "email": payload.email,
         "password": hashed,
-        "role": payload.role,
+        "role": payload.role.value,
     }
-    inserted = await create_document("user", user_doc)
-    inserted["id"] = str(inserted.pop("_id"))
+    # The unique email index enforces uniqueness atomically; no pre-check read.
+    try:
+        inserted = await create_document("user", user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    inserted["id"] = inserted.pop("_id")
     inserted.pop("password", None)
     return inserted
 
 @app.post("/auth/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    users = await get_documents("user", {"email": form_data.username}, limit=1)
-    if not users:
+    user = await db["user"].find_one({"email": form_data.username}, {"password": 1, "role": 1})
+    if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
-    user = users[0]
-    if not verify_password(form_data.password, user.get("password", "")):
+    if not await verify_password(form_data.password, user.get("password", "")):
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     access_token = create_access_token({"sub": str(user["_id"]), "role": user.get("role", "user")})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/auth/me", response_model=UserPublic)
 async def me(current=Depends(get_current_user)):
-    current["id"] = str(current.pop("_id"))
+    # Copy so the cached document keeps its _id for later requests.
+    current = dict(current)
+    current["id"] = current.pop("_id")
     current.pop("password", None)
     return current
 
@@ -158,16 +307,19 @@ async def me(current=Depends(get_current_user)):
 # ======================
 @app.post("/products", response_model=ProductPublic, dependencies=[Depends(require_admin)])
 async def create_product(payload: ProductCreate):
-    doc = payload.dict()
+    doc = PRODUCT_ADAPTER.dump_python(payload)
     inserted = await create_document("product", doc)
-    inserted["id"] = str(inserted.pop("_id"))
+    inserted["id"] = inserted.pop("_id")
     return inserted
 
-@app.get("/products", response_model=List[ProductPublic])
+# List endpoints return DB documents directly; re-validating each row against a
+# response_model would repeat the work Pydantic already did on insert.
+@app.get("/products")
 async def list_products(q: Optional[str] = None, category: Optional[str] = None, min_price: Optional[float] = None, max_price: Optional[float] = None, limit: int = 100):
     filt = {}
     if q:
-        filt["name"] = {"$regex": q, "$options": "i"}
+        # $text uses the inverted text index instead of a regex collection scan.
+        filt["$text"] = {"$search": q}
     if category:
         filt["category"] = category
     price_filter = {}
@@ -177,12 +329,29 @@ async def list_products(q: Optional[str] = None, category: Optional[str] = None,
         price_filter["$lte"] = max_price
     if price_filter:
         filt["price"] = price_filter
-    docs = await get_documents("product", filt, limit)
-    results = []
-    for d in docs:
-        d["id"] = str(d.pop("_id"))
-        results.append(d)
-    return results
+    if q:
+        cursor = db["product"].find(filt, {**PRODUCT_PROJECTION, "score": {"$meta": "textScore"}})
+        cursor = cursor.sort([("score", {"$meta": "textScore"})])
+    else:
+        cursor = db["product"].find(filt, PRODUCT_PROJECTION)
+    cursor = cursor.limit(limit)
+
+    async def stream():
+        # Encode one document at a time so the handler never materializes the
+        # full list and the first bytes go out while Mongo is still reading.
+        yield b"["
+        first = True
+        async for d in cursor:
+            d["id"] = d.pop("_id")
+            d.pop("score", None)
+            if first:
+                first = False
+            else:
+                yield b","
+            yield orjson.dumps(d)
+        yield b"]"
+
+    return StreamingResponse(stream(), media_type="application/json")
 
 @app.get("/products/{product_id}", response_model=ProductPublic)
 async def get_product(product_id: str):
@@ -190,18 +359,18 @@ async def get_product(product_id: str):
     if not docs:
         raise HTTPException(status_code=404, detail="Product not found")
     doc = docs[0]
-    doc["id"] = str(doc.pop("_id"))
+    doc["id"] = doc.pop("_id")
     return doc
 
 @app.put("/products/{product_id}", response_model=ProductPublic, dependencies=[Depends(require_admin)])
 async def update_product(product_id: str, payload: ProductCreate):
     # Simple replacement update using create_document helper not provided; so using db directly
-    await db["product"].update_one({"_id": product_id}, {"$set": payload.dict()})
+    await db["product"].update_one({"_id": product_id}, {"$set": PRODUCT_ADAPTER.dump_python(payload)})
     docs = await get_documents("product", {"_id": product_id}, limit=1)
     if not docs:
         raise HTTPException(status_code=404, detail="Product not found")
     doc = docs[0]
-    doc["id"] = str(doc.pop("_id"))
+    doc["id"] = doc.pop("_id")
     return doc
 
 @app.delete("/products/{product_id}", dependencies=[Depends(require_admin)])
@@ -216,29 +385,28 @@ async def delete_product(product_id: str):
 # ======================
 @app.post("/discounts", response_model=DiscountPublic, dependencies=[Depends(require_admin)])
 async def create_discount(payload: DiscountCreate):
-    inserted = await create_document("discount", payload.dict())
-    inserted["id"] = str(inserted.pop("_id"))
+    inserted = await create_document("discount", payload.model_dump())
+    inserted["id"] = inserted.pop("_id")
     return inserted
 
-@app.get("/discounts", response_model=List[DiscountPublic], dependencies=[Depends(require_admin)])
+@app.get("/discounts", dependencies=[Depends(require_admin)])
 async def list_discounts(limit: int = 100):
-    docs = await get_documents("discount", {}, limit)
+    docs = await db["discount"].find({}, DISCOUNT_PROJECTION).limit(limit).to_list(length=limit)
     results = []
     for d in docs:
-        d["id"] = str(d.pop("_id"))
+        d["id"] = d.pop("_id")
         results.append(d)
     return results
 
 # ======================
 # Users (Admin)
 # ======================
-@app.get("/users", response_model=List[UserPublic], dependencies=[Depends(require_admin)])
+@app.get("/users", dependencies=[Depends(require_admin)])
 async def list_users(limit: int = 100):
-    docs = await get_documents("user", {}, limit)
+    docs = await db["user"].find({}, USER_PROJECTION).limit(limit).to_list(length=limit)
     results = []
     for u in docs:
-        u["id"] = str(u.pop("_id"))
-        u.pop("password", None)
+        u["id"] = u.pop("_id")
         results.append(u)
     return results
 
@@ -247,11 +415,12 @@ async def delete_user(user_id: str):
     res = await db["user"].delete_one({"_id": user_id})
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    USER_CACHE.pop(user_id, None)
     return {"success": True}
 
 # Health / test
 @app.get("/test")
 async def test():
     # Verify DB connection
-    await db["__ping__"].insert_one({"ok": True, "ts": datetime.utcnow()})
+    await db["__ping__"].insert_one({"ok": True, "ts": time.time()})
     return {"status": "ok"}